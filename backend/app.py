@@ -3,11 +3,12 @@ from flask_cors import CORS
 import os
 import sqlite3
 import hashlib
+import hmac
 import random
 import string
 import json
 import re
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 from werkzeug.utils import secure_filename
 
@@ -19,6 +20,13 @@ FRONTEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'fr
 DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'college.db'))
 UPLOAD_FOLDER = os.path.join(FRONTEND_DIR, 'static', 'images')
 
+# UPDATE ... FROM (stock adjustment) needs 3.33+, RETURNING (cancel_order) needs 3.35+
+if sqlite3.sqlite_version_info < (3, 35, 0):
+    raise RuntimeError(f"SQLite 3.35.0 or newer is required, found {sqlite3.sqlite_version}")
+
+# Timezone used for all stored timestamps
+IST = pytz.timezone('Asia/Kolkata')
+
 # Create directories
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -27,25 +35,51 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # ---------------------- Context Manager for DB ---------------------- #
 from contextlib import contextmanager
+import queue
+
+DB_POOL_SIZE = 8
+_db_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+
+def _open_db_connection():
+    """Open a new connection with the per-connection PRAGMAs applied."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    # WAL (set once in initialize_db) only needs fsync at checkpoints with NORMAL
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
 
 @contextmanager
 def get_db_connection():
-    """Context manager for database connections to ensure proper cleanup."""
-    conn = sqlite3.connect(DB_PATH)
+    """Context manager that borrows a pooled connection and returns it clean."""
+    try:
+        conn = _db_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_db_connection()
     try:
         yield conn
     except Exception as e:
         conn.rollback()
         raise
     finally:
-        conn.close()
+        # Discard anything the handler did not commit (e.g. early error returns)
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _db_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
 
 
 # ---------------------- DB Setup ---------------------- #
+# Bump whenever the default data seeded below changes
+DEFAULT_DATA_VERSION = 1
+
 def initialize_db():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
+    # WAL lets readers proceed while an order is being written; it persists in the DB file
+    cursor.execute("PRAGMA journal_mode=WAL")
+
     # Users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -86,6 +120,10 @@ def initialize_db():
         )
     ''')
 
+    # Orders indexes: date-range revenue / recent orders, and per-customer history
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at, total_price)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders(customer_email, created_at)")
+
     # Notifications table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS notifications (
@@ -112,14 +150,22 @@ def initialize_db():
         )
     ''')
 
-    # Insert default admin if not exists
-    cursor.execute("SELECT * FROM users WHERE email = ?", ('kioskadmin@saintgits.org',))
-    if not cursor.fetchone():
+    # Indexes for the remaining hot lookups: pending-user lists, per-recipient
+    # notifications (newest first) and the activity log ordered by time
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_status ON users(status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notifications_recipient ON notifications(recipient_email, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_activity_log_timestamp ON activity_log(timestamp)")
+
+    # Seed default data only once per DEFAULT_DATA_VERSION (tracked in PRAGMA user_version)
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < DEFAULT_DATA_VERSION:
+        # Insert default admin if not exists (email is UNIQUE, so this is a no-op once seeded)
         admin_password = hashlib.sha256("QAZwsx1!".encode()).hexdigest()
         cursor.execute('''
-            INSERT INTO users (name, email, password, role, status)
+            INSERT OR IGNORE INTO users (name, email, password, role, status)
             VALUES (?, ?, ?, ?, ?)
         ''', ('Admin', 'kioskadmin@saintgits.org', admin_password, 'admin', 'approved'))
+        cursor.execute(f"PRAGMA user_version = {DEFAULT_DATA_VERSION}")
 
     conn.commit()
     conn.close()
@@ -127,12 +173,17 @@ def initialize_db():
 initialize_db()
 
 # ---------------------- Validation Functions ---------------------- #
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+UPPERCASE_RE = re.compile(r'[A-Z]')
+LOWERCASE_RE = re.compile(r'[a-z]')
+DIGIT_RE = re.compile(r'\d')
+SPECIAL_CHAR_RE = re.compile(r'[!@#$%^&*(),.?":{}|<>]')
+
 def validate_email(email):
     """Validate email format."""
     if not email or not isinstance(email, str):
         return False
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(email_pattern, email) is not None
+    return EMAIL_RE.match(email) is not None
 
 def validate_password(password):
     """
@@ -143,13 +194,13 @@ def validate_password(password):
         return False, "Password is required"
     if len(password) < 8:
         return False, "Password must be at least 8 characters"
-    if not re.search(r'[A-Z]', password):
+    if not UPPERCASE_RE.search(password):
         return False, "Password must contain at least one uppercase letter"
-    if not re.search(r'[a-z]', password):
+    if not LOWERCASE_RE.search(password):
         return False, "Password must contain at least one lowercase letter"
-    if not re.search(r'\d', password):
+    if not DIGIT_RE.search(password):
         return False, "Password must contain at least one digit"
-    if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
+    if not SPECIAL_CHAR_RE.search(password):
         return False, "Password must contain at least one special character"
     return True, "Valid"
 
@@ -204,6 +255,33 @@ def validate_required_fields(data, required_fields):
 def generate_otp():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
+# Adds sign * qty to menu.stock for every {"id", "qty"} entry in a JSON array
+STOCK_ADJUST_SQL = """
+    UPDATE menu SET stock = stock + ? * v.qty
+    FROM (SELECT CAST(json_extract(value, '$.id') AS INTEGER) AS id,
+                 SUM(json_extract(value, '$.qty')) AS qty
+          FROM json_each(?)
+          GROUP BY CAST(json_extract(value, '$.id') AS INTEGER)) AS v
+    WHERE menu.id = v.id
+"""
+
+def ist_timestamp():
+    """Current IST time formatted the way timestamps are stored in the DB."""
+    return datetime.now(IST).strftime('%Y-%m-%d %H:%M:%S')
+
+def get_menu_lookup(cursor):
+    """Load menu details once as {id: (name, price, category)} to avoid per-item queries."""
+    cursor.execute("SELECT id, name, price, category FROM menu")
+    return {row[0]: row[1:] for row in cursor}
+
+def find_menu_item(menu_lookup, item_id):
+    """Look up a stored order item id, which may be an int or a numeric string."""
+    try:
+        key = float(item_id)
+    except (TypeError, ValueError):
+        return None
+    return menu_lookup.get(int(key)) if key.is_integer() else None
+
 
 # ---------------------- Serve Pages ---------------------- #
 @app.route('/')
@@ -294,11 +372,11 @@ def login_user():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id, name, email, role, status FROM users WHERE email = ? AND password = ?",
-                           (email, hashed_password))
+            cursor.execute("SELECT id, name, email, role, status, password FROM users WHERE email = ?", (email,))
             user = cursor.fetchone()
 
-        if user:
+        # Compare hashes in constant time rather than matching the password in SQL
+        if user and hmac.compare_digest(user[5] or '', hashed_password):
             if user[4] != 'approved':
                 return jsonify({'error': 'Account pending approval'}), 403
             return jsonify({
@@ -347,12 +425,9 @@ def approve_user():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            # Check if user exists
-            cursor.execute("SELECT id FROM users WHERE email=?", (email,))
-            if not cursor.fetchone():
-                return jsonify({'error': 'User not found'}), 404
-            
             cursor.execute("UPDATE users SET status='approved', role=? WHERE email=?", (role, email))
+            if cursor.rowcount == 0:
+                return jsonify({'error': 'User not found'}), 404
             conn.commit()
         return jsonify({'message': f'User {email} approved with role {role}'}), 200
     except Exception as e:
@@ -380,12 +455,9 @@ def assign_role():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            # Check if user exists
-            cursor.execute("SELECT id FROM users WHERE email=? AND status='approved'", (email,))
-            if not cursor.fetchone():
-                return jsonify({'error': 'User not found or not approved'}), 404
-            
             cursor.execute("UPDATE users SET role=? WHERE email=? AND status='approved'", (role, email))
+            if cursor.rowcount == 0:
+                return jsonify({'error': 'User not found or not approved'}), 404
             conn.commit()
         return jsonify({'message': f'Role {role} assigned to {email}'}), 200
     except Exception as e:
@@ -411,12 +483,9 @@ def delete_user():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            # Check if user exists
-            cursor.execute("SELECT id FROM users WHERE email=?", (email,))
-            if not cursor.fetchone():
-                return jsonify({'error': 'User not found'}), 404
-            
             cursor.execute("DELETE FROM users WHERE email=?", (email,))
+            if cursor.rowcount == 0:
+                return jsonify({'error': 'User not found'}), 404
             conn.commit()
         return jsonify({'message': f'User {email} deleted'}), 200
     except Exception as e:
@@ -430,7 +499,7 @@ def get_users():
             cursor = conn.cursor()
             cursor.execute("SELECT name, email, role, status FROM users")
             users = [{'name': name, 'email': email, 'role': role, 'status': status} 
-                    for (name, email, role, status) in cursor.fetchall()]
+                    for (name, email, role, status) in cursor]
         return jsonify(users), 200
     except Exception as e:
         print(f"Error fetching users: {e}")
@@ -442,20 +511,21 @@ def get_menu():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM menu")
+            cursor.row_factory = sqlite3.Row
+            cursor.execute("SELECT id, name, price, category, image, available, stock, deliverable FROM menu")
             menu = cursor.fetchall()
         
         # Convert to dicts
         return jsonify([
             {
-                'id': row[0],
-                'name': row[1],
-                'price': row[2],
-                'category': row[3],
-                'image': row[4],
-                'available': bool(row[5]),
-                'stock': row[6],
-                'deliverable': bool(row[7])
+                'id': row['id'],
+                'name': row['name'],
+                'price': row['price'],
+                'category': row['category'],
+                'image': row['image'],
+                'available': bool(row['available']),
+                'stock': row['stock'],
+                'deliverable': bool(row['deliverable'])
             }
             for row in menu
         ]), 200
@@ -651,12 +721,9 @@ def delete_menu_item(item_id):
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            # Check if item exists
-            cursor.execute("SELECT id FROM menu WHERE id=?", (item_id,))
-            if not cursor.fetchone():
-                return jsonify({'error': 'Menu item not found'}), 404
-            
             cursor.execute("DELETE FROM menu WHERE id=?", (item_id,))
+            if cursor.rowcount == 0:
+                return jsonify({'error': 'Menu item not found'}), 404
             conn.commit()
         return jsonify({'message': 'Menu item deleted successfully'}), 200
     except Exception as e:
@@ -669,34 +736,29 @@ def get_orders():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            menu_lookup = get_menu_lookup(cursor)
             cursor.execute("SELECT id, customer_name, customer_email, items, total_price, otp, status, created_at FROM orders ORDER BY id DESC")
-            rows = cursor.fetchall()
             
+            # Stream rows from the cursor rather than materializing them all first
             orders = []
-            for r in rows:
+            for r in cursor:
                 # Parse items safely using json.loads instead of eval
                 try:
-                    order_data = json.loads(r[3]) if isinstance(r[3], str) else r[3]
+                    order_data = json.loads(r['items']) if isinstance(r['items'], str) else r['items']
                 except (json.JSONDecodeError, TypeError):
                     # If JSON parsing fails, try to handle old eval format
                     try:
-                        order_data = eval(r[3]) if isinstance(r[3], str) else r[3]
+                        order_data = eval(r['items']) if isinstance(r['items'], str) else r['items']
                     except:
                         order_data = {"items": []}
 
                 detailed_items = []
                 for i in order_data.get("items", []):
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("SELECT name, price, category FROM menu WHERE id=?", (i["id"],))
-                        m = cur.fetchone()
-                        item_name = m[0] if m else f"ID:{i['id']}"
-                        item_price = m[1] if m else 0
-                        item_category = m[2] if m else "Other"
-                    except Exception:
-                        item_name = f"ID:{i['id']}"
-                        item_price = 0
-                        item_category = "Other"
+                    m = find_menu_item(menu_lookup, i["id"])
+                    item_name = m[0] if m else f"ID:{i['id']}"
+                    item_price = m[1] if m else 0
+                    item_category = m[2] if m else "Other"
 
                     detailed_items.append({
                         "id": i["id"],
@@ -707,14 +769,14 @@ def get_orders():
                     })
 
                 orders.append({
-                    "id": r[0],
-                    "customer_name": r[1],
-                    "customer_email": r[2],
+                    "id": r['id'],
+                    "customer_name": r['customer_name'],
+                    "customer_email": r['customer_email'],
                     "items": detailed_items,
-                    "total_price": r[4],
-                    "otp": r[5],
-                    "status": r[6],
-                    "created_at": r[7]
+                    "total_price": r['total_price'],
+                    "otp": r['otp'],
+                    "status": r['status'],
+                    "created_at": r['created_at']
                 })
             
         return jsonify(orders), 200
@@ -759,37 +821,35 @@ def create_order():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            # Take the write lock up front so the stock check and deduction are atomic
+            cursor.execute("BEGIN IMMEDIATE")
 
-            # Check stock
+            # Check stock and collect delivery info in a single pass
+            has_deliverable = False
+            total_qty = 0
             for item in items:
                 if not isinstance(item, dict) or 'id' not in item or 'qty' not in item:
                     return jsonify({'error': 'Invalid item format'}), 400
-                
+
                 is_valid, qty = validate_positive_number(item['qty'], "Quantity")
                 if not is_valid:
                     return jsonify({'error': f"Invalid quantity for item {item.get('id')}: {qty}"}), 400
-                
-                cursor.execute("SELECT stock FROM menu WHERE id=?", (item['id'],))
+
+                cursor.execute("SELECT stock, deliverable FROM menu WHERE id=?", (item['id'],))
                 row = cursor.fetchone()
                 if not row or row[0] < item['qty']:
                     return jsonify({'error': f"Not enough stock for item {item['id']}"}), 400
 
+                if row[1] == 1:
+                    has_deliverable = True
+                total_qty += item['qty']
+
             # Delivery charge logic (by quantity not rupees)
-            if delivery_mode == 'delivery':
-                deliverable_items = []
-                total_qty = 0
-                for i in items:
-                    cursor.execute("SELECT deliverable FROM menu WHERE id=?", (i['id'],))
-                    r = cursor.fetchone()
-                    if r and r[0] == 1:
-                        deliverable_items.append(i)
-                    total_qty += i['qty']
-                if deliverable_items and total_qty < 5:
-                    total_price += 5
-
-            # Deduct stock
-            for item in items:
-                cursor.execute("UPDATE menu SET stock = stock - ? WHERE id=?", (item['qty'], item['id']))
+            if delivery_mode == 'delivery' and has_deliverable and total_qty < 5:
+                total_price += 5
+
+            # Deduct stock for all items in one statement
+            cursor.execute(STOCK_ADJUST_SQL, (-1, json.dumps(items)))
 
             otp = generate_otp()
 
@@ -804,8 +864,7 @@ def create_order():
             }
 
             # Get current timestamp in IST
-            ist = pytz.timezone('Asia/Kolkata')
-            current_timestamp = datetime.now(ist).strftime('%Y-%m-%d %H:%M:%S')
+            current_timestamp = ist_timestamp()
 
             cursor.execute(
                 "INSERT INTO orders (customer_name, customer_email, items, total_price, otp, created_at) VALUES (?,?,?,?,?,?)",
@@ -834,12 +893,9 @@ def update_order_status(order_id):
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            # Check if order exists
-            cursor.execute("SELECT id FROM orders WHERE id=?", (order_id,))
-            if not cursor.fetchone():
-                return jsonify({'error': 'Order not found'}), 404
-            
             cursor.execute("UPDATE orders SET status=? WHERE id=?", (status, order_id))
+            if cursor.rowcount == 0:
+                return jsonify({'error': 'Order not found'}), 404
             conn.commit()
         return jsonify({'message': 'Order status updated successfully'}), 200
     except Exception as e:
@@ -853,18 +909,24 @@ def cancel_order(order_id):
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # Get order details
-            cursor.execute("SELECT items, status, customer_email FROM orders WHERE id=?", (order_id,))
+            # Claim the order and fetch its details atomically, so two concurrent
+            # cancellations cannot both restore stock
+            cursor.execute("""
+                UPDATE orders SET status='Cancelled'
+                WHERE id=? AND status NOT IN ('Completed', 'Cancelled')
+                RETURNING items, customer_email
+            """, (order_id,))
             order = cursor.fetchone()
             
             if not order:
-                return jsonify({'error': 'Order not found'}), 404
-            
-            items_json, current_status, customer_email = order
+                cursor.execute("SELECT status FROM orders WHERE id=?", (order_id,))
+                row = cursor.fetchone()
+                if not row:
+                    return jsonify({'error': 'Order not found'}), 404
+                # Check if order can be cancelled
+                return jsonify({'error': f'Cannot cancel order with status: {row[0]}'}), 400
             
-            # Check if order can be cancelled
-            if current_status in ['Completed', 'Cancelled']:
-                return jsonify({'error': f'Cannot cancel order with status: {current_status}'}), 400
+            items_json, customer_email = order
             
             # Parse order items
             try:
@@ -873,15 +935,11 @@ def cancel_order(order_id):
             except (json.JSONDecodeError, TypeError):
                 return jsonify({'error': 'Invalid order data'}), 500
             
-            # Restore stock for each item
-            for item in items:
-                item_id = item.get('id')
-                quantity = item.get('qty', 0)
-                if item_id and quantity > 0:
-                    cursor.execute("UPDATE menu SET stock = stock + ? WHERE id=?", (quantity, item_id))
-            
-            # Update order status to Cancelled
-            cursor.execute("UPDATE orders SET status='Cancelled' WHERE id=?", (order_id,))
+            # Restore stock for all items in one statement
+            cursor.execute(STOCK_ADJUST_SQL, (1, json.dumps([
+                item for item in items
+                if item.get('id') and item.get('qty', 0) > 0
+            ])))
             
             # Create notification for user
             cursor.execute('''
@@ -991,31 +1049,29 @@ def get_staff_stats():
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            # Total menu items
-            cursor.execute("SELECT COUNT(*) FROM menu")
-            total_items = cursor.fetchone()[0]
-            
-            # Total orders
-            cursor.execute("SELECT COUNT(*) FROM orders")
-            total_orders = cursor.fetchone()[0]
-            
-            # Pending orders
-            cursor.execute("SELECT COUNT(*) FROM orders WHERE status IN ('Order Received', 'Preparing')")
-            pending_orders = cursor.fetchone()[0]
-            
-            # Total users
-            cursor.execute("SELECT COUNT(*) FROM users WHERE status = 'approved'")
-            total_users = cursor.fetchone()[0]
-            
-            # Pending user requests
-            cursor.execute("SELECT COUNT(*) FROM users WHERE status = 'pending'")
-            pending_users = cursor.fetchone()[0]
-            
-            # Today's revenue (using IST)
-            ist = pytz.timezone('Asia/Kolkata')
-            today = datetime.now(ist).strftime('%Y-%m-%d')
-            cursor.execute("SELECT COALESCE(SUM(total_price), 0) FROM orders WHERE DATE(created_at) = ?", (today,))
-            today_revenue = cursor.fetchone()[0]
+            # Today's revenue is computed using IST. created_at is stored as
+            # 'YYYY-MM-DD HH:MM:SS', so compare the raw column against a half-open
+            # day range instead of DATE(created_at) to keep the index usable.
+            today = datetime.now(IST).date()
+            day_start = today.isoformat()
+            day_end = (today + timedelta(days=1)).isoformat()
+
+            # Menu, order and user counts plus today's revenue in one round trip
+            cursor.execute("""
+                SELECT (SELECT COUNT(*) FROM menu),
+                       o.total, o.pending,
+                       u.approved, u.pending,
+                       (SELECT COALESCE(SUM(total_price), 0) FROM orders
+                        WHERE created_at >= ? AND created_at < ?)
+                FROM (SELECT COUNT(*) AS total,
+                             COALESCE(SUM(status IN ('Order Received', 'Preparing')), 0) AS pending
+                      FROM orders) AS o,
+                     (SELECT COALESCE(SUM(status = 'approved'), 0) AS approved,
+                             COALESCE(SUM(status = 'pending'), 0) AS pending
+                      FROM users) AS u
+            """, (day_start, day_end))
+            (total_items, total_orders, pending_orders,
+             total_users, pending_users, today_revenue) = cursor.fetchone()
             
             return jsonify({
                 'total_items': total_items,
@@ -1053,11 +1109,9 @@ def staff_approve_user(user_id):
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
-            if not cursor.fetchone():
-                return jsonify({'error': 'User not found'}), 404
-            
             cursor.execute("UPDATE users SET status = 'approved', role = 'user' WHERE id = ?", (user_id,))
+            if cursor.rowcount == 0:
+                return jsonify({'error': 'User not found'}), 404
             conn.commit()
         return jsonify({'message': 'User approved successfully'}), 200
     except Exception as e:
@@ -1070,11 +1124,9 @@ def staff_reject_user(user_id):
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
-            if not cursor.fetchone():
-                return jsonify({'error': 'User not found'}), 404
-            
             cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            if cursor.rowcount == 0:
+                return jsonify({'error': 'User not found'}), 404
             conn.commit()
         return jsonify({'message': 'User rejected successfully'}), 200
     except Exception as e:
@@ -1088,37 +1140,31 @@ def get_recent_orders():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            menu_lookup = get_menu_lookup(cursor)
             cursor.execute("""
                 SELECT id, customer_name, customer_email, items, total_price, otp, status, created_at 
                 FROM orders 
                 ORDER BY created_at DESC 
                 LIMIT ?
             """, (limit,))
-            rows = cursor.fetchall()
             
             orders = []
-            for r in rows:
+            for r in cursor:
                 try:
-                    order_data = json.loads(r[3]) if isinstance(r[3], str) else r[3]
+                    order_data = json.loads(r['items']) if isinstance(r['items'], str) else r['items']
                 except (json.JSONDecodeError, TypeError):
                     try:
-                        order_data = eval(r[3]) if isinstance(r[3], str) else r[3]
+                        order_data = eval(r['items']) if isinstance(r['items'], str) else r['items']
                     except:
                         order_data = {"items": []}
 
                 detailed_items = []
                 for i in order_data.get("items", []):
-                    try:
-                        cur = conn.cursor()
-                        cur.execute("SELECT name, price, category FROM menu WHERE id=?", (i["id"],))
-                        m = cur.fetchone()
-                        item_name = m[0] if m else f"ID:{i['id']}"
-                        item_price = m[1] if m else 0
-                        item_category = m[2] if m else "Other"
-                    except Exception:
-                        item_name = f"ID:{i['id']}"
-                        item_price = 0
-                        item_category = "Other"
+                    m = find_menu_item(menu_lookup, i["id"])
+                    item_name = m[0] if m else f"ID:{i['id']}"
+                    item_price = m[1] if m else 0
+                    item_category = m[2] if m else "Other"
 
                     detailed_items.append({
                         "id": i["id"],
@@ -1129,14 +1175,14 @@ def get_recent_orders():
                     })
 
                 orders.append({
-                    "id": r[0],
-                    "customer_name": r[1],
-                    "customer_email": r[2],
+                    "id": r['id'],
+                    "customer_name": r['customer_name'],
+                    "customer_email": r['customer_email'],
                     "items": detailed_items,
-                    "total_price": r[4],
-                    "otp": r[5],
-                    "status": r[6],
-                    "created_at": r[7],
+                    "total_price": r['total_price'],
+                    "otp": r['otp'],
+                    "status": r['status'],
+                    "created_at": r['created_at'],
                     "delivery_mode": order_data.get("delivery_mode", "pickup"),
                     "classroom": order_data.get("classroom", ""),
                     "department": order_data.get("department", ""),
@@ -1161,8 +1207,7 @@ def log_activity():
         with get_db_connection() as conn:
             cursor = conn.cursor()
             # Use IST (Indian Standard Time) timezone
-            ist = pytz.timezone('Asia/Kolkata')
-            local_timestamp = datetime.now(ist).strftime('%Y-%m-%d %H:%M:%S')
+            local_timestamp = ist_timestamp()
             cursor.execute('''
                 INSERT INTO activity_log (admin_email, action, details, ip_address, timestamp)
                 VALUES (?, ?, ?, ?, ?)
@@ -1205,6 +1250,7 @@ def get_user_orders(email):
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = sqlite3.Row
             cursor.execute('''
                 SELECT id, customer_name, customer_email, items, total_price, 
                        status, otp, created_at
@@ -1212,18 +1258,18 @@ def get_user_orders(email):
                 WHERE customer_email = ? 
                 ORDER BY created_at DESC
             ''', (email,))
-            orders = cursor.fetchall()
+            orders = [{
+                'id': order['id'],
+                'customer_name': order['customer_name'],
+                'customer_email': order['customer_email'],
+                'items': order['items'],  # JSON string
+                'total_price': order['total_price'],
+                'status': order['status'],
+                'otp': order['otp'],
+                'created_at': order['created_at']
+            } for order in cursor]
         
-        return jsonify([{
-            'id': order[0],
-            'customer_name': order[1],
-            'customer_email': order[2],
-            'items': order[3],  # JSON string
-            'total_price': order[4],
-            'status': order[5],
-            'otp': order[6],
-            'created_at': order[7]
-        } for order in orders]), 200
+        return jsonify(orders), 200
     except Exception as e:
         print(f"Error fetching user orders: {e}")
         return jsonify({'error': 'Failed to fetch orders'}), 500